@@ -1,47 +1,64 @@
+import hashlib
+import io
 import os
-import json
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-HOSPITAL_SRC_DIR = r"C:\Users\vigne\Downloads\spotbugs"
+import orjson
+
+from ollama_client import OLLAMA_KEEP_ALIVE, OLLAMA_MODEL, OLLAMA_OPTIONS, OLLAMA_SESSION, OLLAMA_URL
+from project_source import format_project_files, load_project_source, split_project_source
+from summarize_code_llama import build_comprehension_prompt, build_html_page
 
-OLLAMA_MODEL = "llama3.2"
+try:
+    import json_repair
+except ImportError:  # optional: only used to salvage malformed JSON output
+    json_repair = None
 
-OLLAMA_URL = "http://localhost:11434/api/generate"
+HOSPITAL_SRC_DIR = r"C:\Users\vigne\Downloads\spotbugs"
 
 JSON_ISSUES_FILE = "llm_issues.json"
 HTML_REPORT_FILE = "llm_issues_report.html"
+COMPREHENSION_FILE = "code_comprehension.html"
 
+# Generated HTML reports, one file per report request payload (model, prompt
+# with the issues and their code snippets, options)
+REPORT_CACHE_DIR = ".report_cache"
 
-def load_project_source(src_dir: str) -> str:
-    """
-    Reads all .java files under src_dir and returns them as one big string.
-    Each file is prefixed with a marker so the model knows which file is which:
+# Parsed issues, one file per issues request payload (model, prompt, options)
+ISSUES_CACHE_DIR = ".issues_cache"
 
-    === FILE: Hospital.java ===
-    ...code...
+# Results of the single-pass flow (issues, report and comprehension), one file
+# per combined request payload. The prompt holds the whole project code, so
+# any change to a .java file gives a new key.
+COMBINED_CACHE_DIR = ".combined_cache"
 
-    === FILE: Doctor.java ===
-    ...code...
-    """
-    parts = []
-    for root, _, files in os.walk(src_dir):
-        for fname in files:
-            if fname.endswith(".java"):
-                full_path = os.path.join(root, fname)
-                with open(full_path, "r", encoding="utf-8") as f:
-                    code = f.read()
-                parts.append(f"=== FILE: {fname} ===\n{code}\n")
-    if not parts:
-        raise RuntimeError(f"No .java files found under {src_dir}")
-    return "\n".join(parts)
+# When True, issues, HTML report and code comprehension are requested in one
+# Ollama call (see build_combined_prompt) instead of three separate ones.
+SINGLE_PASS = True
 
+# Context window for that combined call: it has to hold the whole project
+# plus all three generated sections, so it needs more than OLLAMA_OPTIONS.
+COMBINED_NUM_CTX = 32768
 
-def build_issues_prompt(project_code: str) -> str:
-    """
-    Builds the text prompt that instructs the LLM to behave like a static analyzer
-    and return a JSON array of issues.
-    """
-    prompt = f"""
+ISSUES_DELIMITER = "<<<ISSUES_JSON>>>"
+REPORT_DELIMITER = "<<<HTML_REPORT>>>"
+COMPREHENSION_DELIMITER = "<<<COMPREHENSION>>>"
+
+# Number of issue requests (one per file group) sent to Ollama at the same time
+# (only used when SINGLE_PASS is False). Kept low because a local Ollama
+# instance usually shares a single GPU.
+MAX_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+# Small files are packed into one issues request until the request would
+# contain more than this many characters of code.
+GROUP_MAX_CHARS = 8000
+
+# Lines of code shown above and below each issue's line in the report prompt
+SNIPPET_CONTEXT_LINES = 10
+
+
+_ISSUES_PROMPT_PREFIX = """
 You are a static analysis tool for a small Java application.
 
 The project is a hospital management system with these kinds of classes:
@@ -50,7 +67,7 @@ The project is a hospital management system with these kinds of classes:
 - Doctor, Patient, Person (domain classes)
 - ExaminationRoom, Specialty (support classes)
 
-I will give you the full source code of these files.
+I will give you the source code of one or more of these files.
 
 Your task: identify likely bugs and problems in the code, including:
 - CORRECTNESS issues (null pointer risk, wrong logic, off-by-one, etc.)
@@ -75,37 +92,72 @@ IMPORTANT RULES:
 - If there are no issues, return an empty JSON array: [].
 - The ENTIRE response must be a JSON array (no extra commentary, no markdown).
 
-Here is the complete project code.
+Here is the code to analyze.
 Each file starts with a '=== FILE: <name> ===' marker:
 
-{project_code}
 """
-    return prompt
+_ISSUES_PROMPT_SUFFIX = "\n"
 
 
-def build_report_prompt(project_code: str, issues: list[dict]) -> str:
+def build_issues_prompt(files: list[tuple[str, str]]) -> str:
     """
-    Builds a prompt asking the LLM to generate a detailed HTML report
-    describing each issue and suggesting possible fixes.
+    Builds the text prompt that instructs the LLM to behave like a static analyzer
+    and return a JSON array of issues for the given (filename, code) files.
     """
-    issues_json = json.dumps(issues, indent=2)
+    return "".join((_ISSUES_PROMPT_PREFIX, format_project_files(files), _ISSUES_PROMPT_SUFFIX))
+
 
-    prompt = f"""
+def build_issue_snippets(project_code: str, issues: list[dict]) -> dict[str, str]:
+    """
+    Returns {issue_id: snippet} with SNIPPET_CONTEXT_LINES lines of code
+    around each issue's line, prefixed with line numbers. Issues whose file
+    or line cannot be resolved are left out. If several files share a name,
+    the first one is used.
+    """
+    lines_by_file = {}
+    for fname, code in split_project_source(project_code):
+        if fname not in lines_by_file:
+            lines_by_file[fname] = code.splitlines()
+
+    snippets = {}
+    for i, issue in enumerate(issues, start=1):
+        fname = issue.get("file")
+        lines = lines_by_file.get(fname) if isinstance(fname, str) else None
+        try:
+            line = int(issue.get("line"))
+        except (TypeError, ValueError):
+            continue
+        if not lines:
+            continue
+
+        first = max(1, line - SNIPPET_CONTEXT_LINES)
+        last = min(len(lines), line + SNIPPET_CONTEXT_LINES)
+        if first > last:
+            continue
+        snippets[str(issue.get("id", f"ISSUE{i}"))] = "\n".join(
+            f"{n:>5} | {lines[n - 1]}" for n in range(first, last + 1)
+        )
+    return snippets
+
+
+_REPORT_PROMPT_PREFIX = """
 You are an expert Java developer and static analysis explainer.
 
 You previously analyzed a small Java hospital management system and produced
 a list of issues in JSON form. I will now give you:
 
-1) The full project source code
+1) The code around each issue, with line numbers, under a '--- <issue id> ---' header
 2) The JSON list of issues that another tool already detected
 
 Your job now is to generate a *detailed HTML report* about these issues.
 
------------------ PROJECT SOURCE CODE -----------------
-{project_code}
+----------------- CODE SNIPPETS PER ISSUE -----------------
+"""
+_REPORT_PROMPT_MIDDLE = """
 
 ----------------- JSON ISSUES LIST -----------------
-{issues_json}
+"""
+_REPORT_PROMPT_SUFFIX = """
 
 ----------------- REPORT REQUIREMENTS -----------------
 
@@ -137,118 +189,626 @@ IMPORTANT:
 - Keep the HTML valid and reasonably clean.
 - Do NOT wrap the HTML in JSON. Return only the HTML document.
 """
-    return prompt
+
+
+def build_report_prompt(issues: list[dict], snippets: dict[str, str]) -> str:
+    """
+    Builds a prompt asking the LLM to generate a detailed HTML report
+    describing each issue and suggesting possible fixes.
+
+    Only the code around each issue (see build_issue_snippets) is included,
+    not the whole project, which keeps the prompt short.
+    """
+    issues_json = orjson.dumps(issues, option=orjson.OPT_INDENT_2).decode()
+    snippets_text = "\n\n".join(
+        f"--- {issue_id} ---\n{snippet}" for issue_id, snippet in snippets.items()
+    )
+    return "".join((
+        _REPORT_PROMPT_PREFIX, snippets_text, _REPORT_PROMPT_MIDDLE, issues_json, _REPORT_PROMPT_SUFFIX
+    ))
+
+
+_COMBINED_PROMPT_PREFIX = f"""
+You are a static analysis tool and an expert Java developer reviewing a small
+hospital management system with these kinds of classes:
+- UI (user interface)
+- Hospital (core logic)
+- Doctor, Patient, Person (domain classes)
+- ExaminationRoom, Specialty (support classes)
+
+I will give you the full source code of these files. Each file starts with a
+'=== FILE: <name> ===' marker.
+
+You must produce THREE sections, in this exact order, each starting with its
+marker on a line of its own:
+
+{ISSUES_DELIMITER}
+{REPORT_DELIMITER}
+{COMPREHENSION_DELIMITER}
+
+----------------- SECTION 1: {ISSUES_DELIMITER} -----------------
+
+Identify likely bugs and problems in the code, including:
+- CORRECTNESS issues (null pointer risk, wrong logic, off-by-one, etc.)
+- BAD_PRACTICE issues (unused fields, suspicious equals/hashCode, etc.)
+- PERFORMANCE issues (unnecessary work in loops, inefficient data structures, etc.)
+- SECURITY issues (unsafe exposure of state, mutable shared collections, etc.)
+- STYLE issues (very minor design/code smells)
+
+Output a JSON array where each issue is an object with the fields:
+"id" (e.g. "ISSUE1"), "file" (e.g. "Hospital.java"), "line" (integer, best guess),
+"category" (one of ["CORRECTNESS", "BAD_PRACTICE", "PERFORMANCE", "SECURITY", "STYLE"]),
+"severity" (one of ["LOW", "MEDIUM", "HIGH"]), "title" (one-line summary) and
+"description" (2–4 sentences explaining why this is a problem).
+Only report issues you are reasonably confident are real. If there are none,
+output []. This section must contain ONLY the JSON array (no markdown).
+
+----------------- SECTION 2: {REPORT_DELIMITER} -----------------
+
+A single, self-contained HTML5 page titled "LLM Static Analysis Report" with a
+small <style> block, an <h1>, a short introduction, a summary of the issues by
+category and severity, and for each issue from section 1:
+- <h2>Issue ID – short title</h2> and a metadata block (file, line, category, severity)
+- a paragraph restating the description in your own words
+- <h3>Root Cause</h3>, <h3>Impact</h3> and <h3>Suggested Fix</h3> subsections of
+  2–4 sentences each (optionally with a short <pre><code> Java snippet)
+and a final conclusion section with next steps.
+
+----------------- SECTION 3: {COMPREHENSION_DELIMITER} -----------------
+
+A VALID HTML FRAGMENT (no <html>, <head>, or <body> tags) explaining the
+project to someone who knows basic Java but not this project: an <h1> overall
+title, then for each file an <h2> with the file name followed by 3–7 <p>
+paragraphs on what the class is for, its important fields and methods, and how
+it interacts with the other classes. <ul>/<li> lists are allowed.
+
+IMPORTANT:
+- Use only the code given; do not invent files, methods or extra issues.
+- Do NOT use markdown or code fences anywhere.
+
+Here is the complete project code:
+
+"""
+_COMBINED_PROMPT_SUFFIX = "\n"
+
+
+def build_combined_prompt(project_code: str) -> str:
+    """
+    Builds one prompt that asks for the issues JSON, the HTML issue report and
+    the code comprehension fragment in a single response, so the project code
+    only has to be sent (and prefilled by the model) once.
+
+    The three parts are separated by the ISSUES_DELIMITER, REPORT_DELIMITER and
+    COMPREHENSION_DELIMITER markers; see split_combined_response().
+    """
+    return "".join((_COMBINED_PROMPT_PREFIX, project_code, _COMBINED_PROMPT_SUFFIX))
+
+
+def split_combined_response(text: str) -> dict[str, str]:
+    """
+    Splits the response to build_combined_prompt() into its sections.
+    Returns a dict with the keys "issues", "report" and "comprehension";
+    a section whose delimiter the model left out is missing from the dict.
+    """
+    found = []
+    for key, delimiter in (
+        ("issues", ISSUES_DELIMITER),
+        ("report", REPORT_DELIMITER),
+        ("comprehension", COMPREHENSION_DELIMITER),
+    ):
+        pos = text.find(delimiter)
+        if pos == -1:
+            print(f"Model output is missing the {delimiter} section.")
+            continue
+        found.append((pos, pos + len(delimiter), key))
+
+    # Each section runs until the next delimiter (or the end of the text),
+    # even if the model emitted them in a different order.
+    found.sort()
+    sections = {}
+    for i, (_, start, key) in enumerate(found):
+        end = found[i + 1][0] if i + 1 < len(found) else len(text)
+        sections[key] = text[start:end].strip()
+    return sections
+
+
+def _stream_response(payload: dict):
+    """
+    Posts the payload with stream=true and yields the 'response' text of each
+    NDJSON line as soon as Ollama produces it. Closing the generator early
+    closes the connection, which makes Ollama stop generating.
+    """
+    with OLLAMA_SESSION.post(OLLAMA_URL, json=payload, stream=True, timeout=300) as resp:
+        if resp.status_code != 200:
+            print("Ollama returned an error status code:", resp.status_code)
+            print("Response body:\n", resp.text[:1000])  # print first 1000 chars for debugging
+            resp.raise_for_status()
+
+        # Lines stay as bytes: orjson parses UTF-8 directly.
+        for line in resp.iter_lines(chunk_size=64 * 1024):
+            if not line:
+                continue
+            chunk = orjson.loads(line)
+            if "error" in chunk:
+                raise RuntimeError(f"Ollama returned an error: {chunk['error']}")
+            yield chunk.get("response", "")
+            if chunk.get("done"):
+                break
+
+
+class _JsonArrayScanner:
+    """
+    Finds the first balanced top-level JSON array in text that arrives in
+    pieces, in a single forward pass. Brackets inside JSON strings
+    (e.g. "list[i]") are ignored.
+
+    After feed() returns True, text[start:end + 1] is the array. offset is
+    the position in the full text of the first character that will be fed.
+    """
+
+    def __init__(self, offset: int = 0):
+        self.start = -1
+        self.end = -1
+        self.offset = offset
+        self._pos = offset
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Scans the next piece of text. Returns True once the array is closed.
+        """
+        if self.end != -1:
+            return True
+
+        for i, ch in enumerate(chunk):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"' and self._depth > 0:
+                self._in_string = True
+            elif ch == "[":
+                if self._depth == 0:
+                    self.start = self._pos + i
+                self._depth += 1
+            elif ch == "]" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.end = self._pos + i
+                    return True
+
+        self._pos += len(chunk)
+        return False
+
+
+def _find_json_array(text: str, pos: int = 0) -> tuple[int, int]:
+    """
+    Returns (start, end) of the first balanced JSON array in text at or after pos.
+    end is -1 if the array is never closed (e.g. truncated output), and
+    both are -1 if there is no array at all.
+    """
+    scanner = _JsonArrayScanner(pos)
+    scanner.feed(text[pos:] if pos else text)
+    return scanner.start, scanner.end
+
+
+def _payload_cache_path(cache_dir: str, payload: dict, ext: str = ".json") -> str:
+    """
+    Path of the cached result for this exact request payload in cache_dir.
+    """
+    key = hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    return os.path.join(cache_dir, key + ext)
+
+
+def _read_json_cache(cache_path: str):
+    """
+    Returns the decoded cache file, or None if there is no readable one.
+    Callers still have to check that it has the expected shape.
+    """
+    try:
+        with open(cache_path, "rb") as f:
+            return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+
+
+def _write_cache_file(cache_path: str, data: bytes) -> None:
+    """
+    Writes data to a temp file first and then swaps it in, so concurrent or
+    interrupted runs never leave a half-written cache file.
+    """
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Could not write cache file {cache_path}: {e}")
+
+
+def _stream_issues(payload: dict) -> list[dict]:
+    """
+    Streams one issues request and parses the JSON array from it.
+
+    While streaming we feed every piece to a _JsonArrayScanner and stop
+    reading as soon as an array of issue objects is closed, so any trailing
+    commentary from the model is never generated or downloaded. Arrays that
+    are not issue lists (e.g. "[see below]" in leading prose) are skipped.
+    """
+    text = io.StringIO()
+    scanner = _JsonArrayScanner()
+    chunks = _stream_response(payload)
+    try:
+        for chunk in chunks:
+            text.write(chunk)
+            pending = chunk
+            while scanner.feed(pending):
+                so_far = text.getvalue()
+                issues = _load_issue_list(so_far[scanner.start : scanner.end + 1])
+                if issues is not None:
+                    return issues
+                # Not an issues array; keep scanning right after it
+                pending = so_far[scanner.end + 1 :]
+                scanner = _JsonArrayScanner(scanner.end + 1)
+    finally:
+        chunks.close()
+
+    # The model's output text is accumulated from the 'response' fields.
+    # If arrays were skipped above, rescan from the start so the error
+    # message shows the first one.
+    skipped = scanner.offset > 0
+    return parse_issues_json(text.getvalue(), None if skipped else (scanner.start, scanner.end))
 
 
 def call_ollama_json(prompt: str):
     """
-    Calls the local Ollama /api/generate endpoint with stream=false.
+    Calls the local Ollama /api/generate endpoint with stream=true.
     We DO NOT use format="json" to avoid server-side 500 errors.
     Instead, we instruct the model via the prompt to output a JSON array,
     then we extract and parse that array from the response text.
 
+    Only if that fails (even after the repair step in parse_issues_json) is
+    the request sent once more, with format="json" and temperature 0.
+    Successfully parsed issues are cached in ISSUES_CACHE_DIR, so running
+    again with the same prompt does not call the model.
+
     Returns: Python list of issue dicts.
     """
     payload = {
         "model": OLLAMA_MODEL,
         "prompt": prompt,
-        "stream": False
+        "stream": True,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": OLLAMA_OPTIONS,
         # no "format": "json" here
     }
 
-    resp = requests.post(OLLAMA_URL, json=payload, timeout=300)
+    cache_path = _payload_cache_path(ISSUES_CACHE_DIR, payload)
+    cached = _read_json_cache(cache_path)
+    if _is_issue_list(cached):
+        return cached
 
-    if resp.status_code != 200:
-        print("Ollama returned an error status code:", resp.status_code)
-        print("Response body:\n", resp.text[:1000])  # print first 1000 chars for debugging
-        resp.raise_for_status()
+    try:
+        issues = _stream_issues(payload)
+    except ValueError as e:
+        print(f"{e}\nRetrying with format=json and temperature 0...")
+        retry_payload = {
+            **payload,
+            "format": "json",
+            "options": {**OLLAMA_OPTIONS, "temperature": 0.0},
+        }
+        issues = _stream_issues(retry_payload)
+
+    _write_cache_file(cache_path, orjson.dumps(issues))
+    return issues
 
-    data = resp.json()
-    # The model's output text is stored in 'response'
-    text = data.get("response", "").strip()
 
-    # The prompt tells the model: "ENTIRE response must be a JSON array"
-    # But just in case it adds some extra text, we extract the part between
-    # the first '[' and the last ']'.
-    start = text.find("[")
-    end = text.rfind("]")
+def _repair_issues_json(json_str: str) -> list | None:
+    """
+    Tries to fix common LLM JSON mistakes (trailing commas, missing closing
+    brackets, unescaped quotes, ...) with the json_repair package.
+    Returns the repaired issues list, or None if that is not possible.
+    """
+    if json_repair is None:
+        return None
+    try:
+        data = json_repair.loads(json_str)
+    except (ValueError, RecursionError):  # RecursionError: very deeply nested input
+        return None
 
-    if start == -1 or end == -1 or end <= start:
-        raise ValueError(
-            "Model output did not contain a JSON array. "
-            "Raw output (first 500 chars):\n" + text[:500]
-        )
+    # format="json" responses are often wrapped in an object
+    if isinstance(data, dict):
+        for key in ["issues", "bugs", "results"]:
+            if isinstance(data.get(key), list):
+                return data[key]
+        return None
+    return data if isinstance(data, list) else None
+
+
+def _is_issue_list(data) -> bool:
+    return isinstance(data, list) and all(isinstance(item, dict) for item in data)
 
-    json_str = text[start : end + 1]
 
+def _load_issue_list(json_str: str) -> list[dict] | None:
+    """
+    Parses json_str (repairing it if needed) and returns it only if it is a
+    list of issue objects; anything else (e.g. ["see below"]) gives None.
+    """
     try:
-        issues = json.loads(json_str)
-    except json.JSONDecodeError as e:
+        data = orjson.loads(json_str)
+    except orjson.JSONDecodeError:
+        data = _repair_issues_json(json_str)
+    return data if _is_issue_list(data) else None
+
+
+def parse_issues_json(text: str, bounds: tuple[int, int] | None = None) -> list[dict]:
+    """
+    Extracts and parses the JSON array of issues from the model's text output.
+    If the caller already knows where the first array is, pass its (start, end)
+    as bounds. Invalid or truncated arrays are run through _repair_issues_json,
+    and arrays that are not lists of issue objects are skipped. Raises
+    ValueError if no usable array is found.
+    """
+    # The prompt tells the model: "ENTIRE response must be a JSON array"
+    # But just in case it adds some extra text, we try each balanced
+    # '[' ... ']' in turn and only parse that part.
+    start, end = bounds if bounds is not None else _find_json_array(text)
+
+    if start == -1:
         raise ValueError(
-            "Failed to parse JSON from model output. "
-            f"Error: {e}\nExtracted JSON string (first 500 chars):\n{json_str[:500]}"
+            "Model output did not contain a JSON array. "
+            "Raw output (first 500 chars):\n" + text[:500]
         )
 
-    return issues
-
+    first_json_str = None
+    while start != -1:
+        # An array that is never closed is usually cut-off output; let the
+        # repair step try to close it.
+        json_str = text[start : end + 1] if end != -1 else text[start:]
+        if first_json_str is None:
+            first_json_str = json_str
 
+        issues = _load_issue_list(json_str)
+        if issues is not None:
+            return issues
+        if end == -1:
+            break
+        start, end = _find_json_array(text, end + 1)
 
+    raise ValueError(
+        "Failed to parse a JSON array of issue objects from model output. "
+        f"First extracted JSON string (first 500 chars):\n{first_json_str[:500]}"
+    )
 
 
-def call_ollama_text(prompt: str) -> str:
+def _text_payload(prompt: str, options: dict | None = None) -> dict:
     """
-    Calls the local Ollama /api/generate endpoint, expecting plain text
-    (here, an HTML document) in the 'response' field.
+    Request payload for call_ollama_text(); also used as a cache key.
+    options override single entries of OLLAMA_OPTIONS for this call.
     """
-    payload = {
+    return {
         "model": OLLAMA_MODEL,
         "prompt": prompt,
-        "stream": False
+        "stream": True,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": {**OLLAMA_OPTIONS, **options} if options else OLLAMA_OPTIONS,
         # NOTE: we intentionally do NOT set format="json" here
     }
 
-    resp = requests.post(OLLAMA_URL, json=payload, timeout=300)
-    resp.raise_for_status()
-    data = resp.json()
 
+def call_ollama_text(prompt: str, options: dict | None = None) -> str:
+    """
+    Calls the local Ollama /api/generate endpoint with stream=true, expecting
+    plain text (here, an HTML document) in the 'response' fields.
+    options override single entries of OLLAMA_OPTIONS for this call.
+    """
     # 'response' contains the model's text output (expected to be HTML).
-    html = data["response"]
-    return html
+    html = io.StringIO()
+    for chunk in _stream_response(_text_payload(prompt, options)):
+        html.write(chunk)
+    return html.getvalue()
+
+
+def group_files_by_length(files: list[tuple[str, str]]) -> list[list[tuple[str, str]]]:
+    """
+    Packs files into request groups, longest first. A file larger than
+    GROUP_MAX_CHARS gets a request of its own; smaller files are packed
+    together until a group would exceed GROUP_MAX_CHARS. Because the groups
+    come out longest first, the slow requests start early and the short ones
+    fill in behind them instead of one huge file finishing last.
+    """
+    groups = []
+    current = []
+    current_chars = 0
+    for fname, code in sorted(files, key=lambda item: len(item[1]), reverse=True):
+        if current and current_chars + len(code) > GROUP_MAX_CHARS:
+            groups.append(current)
+            current = []
+            current_chars = 0
+        current.append((fname, code))
+        current_chars += len(code)
+    if current:
+        groups.append(current)
+    return groups
+
+
+def detect_issues(project_code: str) -> list[dict]:
+    """
+    Sends one issues request per group of .java files (see
+    group_files_by_length), MAX_WORKERS at a time, and merges the returned
+    arrays in the original file order. Issue ids are renumbered so they stay
+    unique.
+    """
+    files = split_project_source(project_code)
+    groups = group_files_by_length(files)
+    workers = min(MAX_WORKERS, len(groups))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [(group, executor.submit(call_ollama_json, build_issues_prompt(group))) for group in groups]
+        per_group = [(group, future.result()) for group, future in futures]
+
+    issues = []
+    for group, group_issues in per_group:
+        for issue in group_issues:
+            if not isinstance(issue, dict):
+                continue
+            if len(group) == 1:
+                issue.setdefault("file", group[0][0])
+            issues.append(issue)
+
+    # Back to project order (issues naming an unknown file, or a "file" that
+    # is not a string, go last)
+    file_order = {}
+    for fname, _ in files:
+        file_order.setdefault(fname, len(file_order))
+    unknown = len(file_order)
+    issues.sort(
+        key=lambda issue: file_order.get(issue["file"], unknown)
+        if isinstance(issue.get("file"), str)
+        else unknown
+    )
+    for i, issue in enumerate(issues, start=1):
+        issue["id"] = f"ISSUE{i}"
+    return issues
 
 
 def generate_html_report(project_code: str, issues: list[dict]) -> str:
     """
     Uses the LLM to generate a detailed HTML report for the given issues.
     Returns the HTML string.
-    """
-    report_prompt = build_report_prompt(project_code, issues)
-    html_report = call_ollama_text(report_prompt)
-    return html_report
 
+    The report is cached in REPORT_CACHE_DIR under a hash of the full request
+    payload, so the LLM is only called again when the issues, their code
+    snippets, the prompt, the model or its options change.
+    """
+    snippets = build_issue_snippets(project_code, issues)
+    report_prompt = build_report_prompt(issues, snippets)
 
-def main():
-    print(f"loading Java files from: {HOSPITAL_SRC_DIR}")
-    project_code = load_project_source(HOSPITAL_SRC_DIR)
+    cache_path = _payload_cache_path(REPORT_CACHE_DIR, _text_payload(report_prompt), ".html")
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            html_report = f.read()
+        print(f"reusing cached html report {cache_path}")
+        return html_report
+    except (OSError, UnicodeDecodeError):
+        pass
 
-    issues_prompt = build_issues_prompt(project_code)
+    html_report = call_ollama_text(report_prompt)
+    _write_cache_file(cache_path, html_report.encode("utf-8"))
+    return html_report
 
-    print(f"using Ollama model '{OLLAMA_MODEL}' via {OLLAMA_URL} to detect issues...")
-    issues = call_ollama_json(issues_prompt)
 
-    # Save JSON issues
+def save_issues(issues: list[dict]) -> None:
     print(f"Ollama reported {len(issues)} issues.")
-    with open(JSON_ISSUES_FILE, "w", encoding="utf-8") as f:
-        json.dump(issues, f, indent=2)
+    with open(JSON_ISSUES_FILE, "wb") as f:
+        f.write(orjson.dumps(issues, option=orjson.OPT_INDENT_2))
     print(f"Find LLM issues in {JSON_ISSUES_FILE}")
 
-    # Generate detailed HTML report
-    print("building html report...")
-    html_report = generate_html_report(project_code, issues)
 
+def save_html_report(html_report: str) -> None:
     with open(HTML_REPORT_FILE, "w", encoding="utf-8") as f:
         f.write(html_report)
     print(f"Saved detailed HTML report to {HTML_REPORT_FILE}")
 
 
+def save_comprehension(html_fragment: str) -> None:
+    with open(COMPREHENSION_FILE, "w", encoding="utf-8") as f:
+        f.write(build_html_page(html_fragment))
+    print(f"Saved code comprehension page to {COMPREHENSION_FILE}")
+
+
+def run_single_pass(project_code: str) -> None:
+    """
+    Gets issues, HTML report and code comprehension from one Ollama call.
+
+    The sections that came back fine are saved first. A missing or
+    unparsable section is then requested on its own, the same way
+    run_separate_passes() does it, so one bad section does not throw away
+    the others.
+
+    The final results are cached in COMBINED_CACHE_DIR, so running again on
+    unchanged code does not call the model.
+    """
+    combined_prompt = build_combined_prompt(project_code)
+    options = {"num_ctx": COMBINED_NUM_CTX}
+    cache_path = _payload_cache_path(COMBINED_CACHE_DIR, _text_payload(combined_prompt, options))
+    cached = _read_json_cache(cache_path)
+    if (
+        isinstance(cached, dict)
+        and _is_issue_list(cached.get("issues"))
+        and isinstance(cached.get("report"), str)
+        and isinstance(cached.get("comprehension"), str)
+    ):
+        print(f"reusing cached results {cache_path}")
+        save_html_report(cached["report"])
+        save_comprehension(cached["comprehension"])
+        save_issues(cached["issues"])
+        return
+
+    print(f"using Ollama model '{OLLAMA_MODEL}' via {OLLAMA_URL} to detect issues, "
+          "build the report and explain the code in one call...")
+    response = call_ollama_text(combined_prompt, options)
+    sections = split_combined_response(response)
+
+    if sections.get("report"):
+        save_html_report(sections["report"])
+    if sections.get("comprehension"):
+        save_comprehension(sections["comprehension"])
+
+    try:
+        issues = parse_issues_json(sections.get("issues", ""))
+    except ValueError as e:
+        print(f"{e}\nRequesting the issues separately...")
+        issues = detect_issues(project_code)
+    save_issues(issues)
+
+    report = sections.get("report")
+    if not report:
+        print("building html report...")
+        report = generate_html_report(project_code, issues)
+        save_html_report(report)
+    comprehension = sections.get("comprehension")
+    if not comprehension:
+        print("building code comprehension...")
+        comprehension = call_ollama_text(build_comprehension_prompt(project_code))
+        save_comprehension(comprehension)
+
+    _write_cache_file(
+        cache_path,
+        orjson.dumps({"issues": issues, "report": report, "comprehension": comprehension}),
+    )
+
+
+def run_separate_passes(project_code: str) -> None:
+    """
+    Detects issues file by file, then asks for the HTML report in a second call
+    (skipped if a report for the same code and issues is already cached).
+    """
+    print(f"using Ollama model '{OLLAMA_MODEL}' via {OLLAMA_URL} to detect issues "
+          f"({MAX_WORKERS} requests at a time)...")
+    issues = detect_issues(project_code)
+    save_issues(issues)
+
+    # Generate detailed HTML report
+    print("building html report...")
+    save_html_report(generate_html_report(project_code, issues))
+
+
+def main():
+    print(f"loading Java files from: {HOSPITAL_SRC_DIR}")
+    project_code = load_project_source(HOSPITAL_SRC_DIR)
+
+    if SINGLE_PASS:
+        run_single_pass(project_code)
+    else:
+        run_separate_passes(project_code)
+
+
 if __name__ == "__main__":
     main()
@@ -1,49 +1,82 @@
-import json
-import pandas as pd
+import csv
+
+import orjson
 
 LLM_JSON = "llm_issues.json"
 SPOTBUGS_CSV = "spotbugs_issues.csv"
 
-
-def map_spotbugs_category(row):
-    cat = row["category"]
-    bug_type = row["spotbugs_type"]
-
-    if cat == "CORRECTNESS":
-        return "CORRECTNESS"
-    if cat == "PERFORMANCE":
-        return "PERFORMANCE"
-    if cat == "SECURITY":
-        return "SECURITY"
-
-    if cat in ("BAD_PRACTICE", "STYLE", "EXPERIMENTAL"):
-        return "BAD_PRACTICE"
-
-    return "BAD_PRACTICE"
-
-
-def map_spotbugs_severity(row):
-    priority = row["priority"]
-    if pd.isna(priority):
+# Key names the LLM may use for each normalized column (compared lowercased)
+CANONICAL_COLUMNS = {
+    "file": ("file", "filename", "sourcefile", "source_file"),
+    "line": ("line", "line_number", "lineno", "start_line"),
+    "category": ("category", "issue_type", "type"),
+    "severity": ("severity", "level", "priority"),
+    "title": ("title", "summary", "short_description"),
+    "description": ("description", "details", "long_description", "message"),
+}
+
+ALIAS_MAP = {alias: canonical for canonical, aliases in CANONICAL_COLUMNS.items() for alias in aliases}
+
+# Normalized columns, in output order, with the value used when the LLM
+# did not produce that column at all (line is converted to a number below)
+LLM_COLUMN_DEFAULTS = {
+    "file": "UNKNOWN_FILE",
+    "line": None,
+    "category": "UNKNOWN",
+    "severity": "MEDIUM",
+    "title": "",
+    "description": "",
+}
+
+
+# SpotBugs categories that have a direct LLM counterpart; everything else
+# (BAD_PRACTICE, STYLE, EXPERIMENTAL, MALICIOUS_CODE, ...) is BAD_PRACTICE
+SPOTBUGS_CATEGORY_MAP = {
+    "CORRECTNESS": "CORRECTNESS",
+    "PERFORMANCE": "PERFORMANCE",
+    "SECURITY": "SECURITY",
+}
+
+SPOTBUGS_SEVERITY_MAP = {1: "HIGH", 2: "MEDIUM"}
+
+
+def map_spotbugs_category(category: str) -> str:
+    return SPOTBUGS_CATEGORY_MAP.get(category, "BAD_PRACTICE")
+
+
+def map_spotbugs_severity(priority: str) -> str:
+    try:
+        p = int(float(priority))
+    except (TypeError, ValueError):
         return "LOW"
-    p = int(priority)
-    if p == 1:
-        return "HIGH"
-    if p == 2:
-        return "MEDIUM"
-    return "LOW"
+    return SPOTBUGS_SEVERITY_MAP.get(p, "LOW")
 
 
-def load_llm_issues(path: str) -> pd.DataFrame:
+def _to_number(value):
     """
-    Load llm_issues.json and normalize columns to:
+    Converts a line value to int/float, or None if it is not a number.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(number) if number.is_integer() else number
+
+
+def load_llm_issues(path: str) -> list[dict]:
+    """
+    Load llm_issues.json and normalize every issue to a dict with the keys:
     file, line, category, severity, title, description
 
     This function is defensive: it tries to handle different JSON shapes and
     different key names produced by the LLM.
     """
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    with open(path, "rb") as f:
+        data = orjson.loads(f.read())
 
     if isinstance(data, dict):
         for key in ["issues", "bugs", "results"]:
@@ -57,65 +90,56 @@ def load_llm_issues(path: str) -> pd.DataFrame:
     if not isinstance(data, list):
         raise RuntimeError(f"Unexpected JSON structure in {path}: {type(data)}")
 
-    df = pd.DataFrame(data)
-    print("Columns from llm_issues.json:", df.columns.tolist())
-
-    col_map = {}
+    records = [item for item in data if isinstance(item, dict)]
+    columns = list(dict.fromkeys(key for record in records for key in record))
+    print("Columns from llm_issues.json:", columns)
 
-    for col in df.columns:
-        lc = col.lower()
-        if lc in ("file", "filename", "sourcefile", "source_file"):
-            col_map[col] = "file"
-        elif lc in ("line", "line_number", "lineno", "start_line"):
-            col_map[col] = "line"
-        elif lc in ("category", "issue_type", "type"):
-            col_map[col] = "category"
-        elif lc in ("severity", "level", "priority"):
-            col_map[col] = "severity"
-        elif lc in ("title", "summary", "short_description"):
-            col_map[col] = "title"
-        elif lc in ("description", "details", "long_description", "message"):
-            col_map[col] = "description"
+    col_map = {c: ALIAS_MAP[c.lower()] for c in columns if c.lower() in ALIAS_MAP}
 
-    df = df.rename(columns=col_map)
+    # A column the LLM never produced gets its default; a column that is only
+    # missing from some issues is None there.
+    missing = {c: v for c, v in LLM_COLUMN_DEFAULTS.items() if c not in col_map.values()}
 
-    if "file" not in df.columns:
-        df["file"] = "UNKNOWN_FILE"
-    if "line" not in df.columns:
-        df["line"] = None
-    if "category" not in df.columns:
-        df["category"] = "UNKNOWN"
-    if "severity" not in df.columns:
-        df["severity"] = "MEDIUM"
-    if "title" not in df.columns:
-        df["title"] = ""
-    if "description" not in df.columns:
-        df["description"] = ""
+    issues = []
+    for record in records:
+        issue = dict.fromkeys(LLM_COLUMN_DEFAULTS)
+        issue.update(missing)
+        for col, canonical in col_map.items():
+            if col in record:
+                issue[canonical] = record[col]
+        issue["line"] = _to_number(issue["line"])
+        issues.append(issue)
 
-    df["line"] = pd.to_numeric(df["line"], errors="coerce")
-
-    return df[["file", "line", "category", "severity", "title", "description"]]
+    return issues
 
 
+def load_spotbugs_issues(path: str) -> list[dict]:
+    """
+    Load spotbugs_issues.csv (see parse_spotbugs.py) and add the normalized
+    norm_category and norm_severity fields to every row.
+    """
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
 
-def load_spotbugs_issues(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
-    df["norm_category"] = df.apply(map_spotbugs_category, axis=1)
-    df["norm_severity"] = df.apply(map_spotbugs_severity, axis=1)
-    return df
+    for row in rows:
+        row["norm_category"] = map_spotbugs_category(row["category"])
+        row["norm_severity"] = map_spotbugs_severity(row["priority"])
+    return rows
 
 
-def evaluate_overlap(llm_df: pd.DataFrame, spot_df: pd.DataFrame):
+def evaluate_overlap(llm_issues: list[dict], spot_issues: list[dict]):
     """
     For simplicity, we define an "issue" by (file, category).
     You can refine this later to use (file, category, severity) or add line ranges.
     """
-    llm_set = set(zip(llm_df["file"], llm_df["category"]))
-    spot_set = set(zip(spot_df["file"], spot_df["norm_category"]))
+    llm_set = frozenset((issue["file"], issue["category"]) for issue in llm_issues)
+    spot_set = frozenset((row["file"], row["norm_category"]) for row in spot_issues)
 
-    both = llm_set & spot_set
-    only_llm = llm_set - spot_set
-    only_spot = spot_set - llm_set
+    # One pass over the LLM keys splits them into "both" and "only LLM"
+    both, only_llm = [], []
+    for key in llm_set:
+        (both if key in spot_set else only_llm).append(key)
+    only_spot = spot_set.difference(llm_set)
 
     print(f"LLM unique (file,category) issues: {len(llm_set)}")
     print(f"SpotBugs unique (file,category) issues: {len(spot_set)}")
@@ -124,11 +148,11 @@ def evaluate_overlap(llm_df: pd.DataFrame, spot_df: pd.DataFrame):
     print(f"Only SpotBugs: {len(only_spot)}")
 
     print("\nExamples of overlap:")
-    for item in list(both)[:5]:
+    for item in both[:5]:
         print("  ", item)
 
     print("\nExamples only in LLM:")
-    for item in list(only_llm)[:5]:
+    for item in only_llm[:5]:
         print("  ", item)
 
     print("\nExamples only in SpotBugs:")
@@ -137,10 +161,10 @@ def evaluate_overlap(llm_df: pd.DataFrame, spot_df: pd.DataFrame):
 
 
 def main():
-    llm_df = load_llm_issues(LLM_JSON)
-    spot_df = load_spotbugs_issues(SPOTBUGS_CSV)
+    llm_issues = load_llm_issues(LLM_JSON)
+    spot_issues = load_spotbugs_issues(SPOTBUGS_CSV)
 
-    evaluate_overlap(llm_df, spot_df)
+    evaluate_overlap(llm_issues, spot_issues)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,27 @@
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+
+OLLAMA_MODEL = "llama3.2"
+
+OLLAMA_URL = "http://localhost:11434/api/generate"
+
+# Keep the model loaded between our calls, and give it a context window large
+# enough for the whole project (Ollama's default would truncate the prompt).
+# num_batch is the number of prompt tokens processed per step during prefill.
+OLLAMA_KEEP_ALIVE = "30m"
+OLLAMA_OPTIONS = {
+    "num_ctx": 16384,
+    "num_predict": -1,
+    "temperature": 0.1,
+    "num_batch": 512,
+}
+
+# One keep-alive session for all calls to the local Ollama server, so the
+# TCP connection is reused instead of being opened for every request.
+# Compression is disabled since the server is on localhost. The pool has
+# room for one connection per concurrent issues request in analyze_llama.py.
+OLLAMA_SESSION = requests.Session()
+OLLAMA_SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=max(8, os.cpu_count() or 1)))
+OLLAMA_SESSION.headers.update({"Connection": "keep-alive", "Accept-Encoding": "identity"})
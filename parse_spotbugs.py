@@ -1,48 +1,78 @@
 import xml.etree.ElementTree as ET
 import csv
+import os
 
 SPOTBUGS_XML = "spotbugs_report.xml"
 OUTPUT_CSV = "spotbugs_issues.csv"
 
 
-def parse_spotbugs_xml(xml_path: str, out_csv: str):
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
+FIELDNAMES = ("file", "line", "spotbugs_type", "category", "priority", "rank")
 
-    rows = []
 
-    for bug in root.iter("BugInstance"):
-        bug_type = bug.get("type")
-        category = bug.get("category")
-        priority = bug.get("priority") 
-        rank = bug.get("rank")
+def iter_bug_rows(xml_path: str):
+    """
+    Streams the SpotBugs XML with iterparse and yields one row tuple
+    (in FIELDNAMES order) per BugInstance that has a SourceLine.
+    Every top-level element is cleared once handled, so memory use does not
+    grow with the size of the report.
+    """
+    depth = 0
+    root = None
+    for event, elem in ET.iterparse(xml_path, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            depth += 1
+            continue
 
-        source_line = bug.find("SourceLine")
-        if source_line is None:
+        depth -= 1
+        if depth != 1:
             continue
 
-        source_file = source_line.get("sourcefile")
-        start_line = source_line.get("start")
+        if elem.tag == "BugInstance":
+            source_line = elem.find("SourceLine")
+            if source_line is not None:
+                start_line = source_line.get("start")
+                yield (
+                    source_line.get("sourcefile"),
+                    int(start_line) if start_line else None,
+                    elem.get("type"),
+                    elem.get("category"),
+                    elem.get("priority"),
+                    elem.get("rank"),
+                )
+
+        # Drop the finished child from the tree
+        root.clear()
 
-        rows.append({
-            "file": source_file,
-            "line": int(start_line) if start_line else None,
-            "spotbugs_type": bug_type,
-            "category": category,
-            "priority": priority,
-            "rank": rank
-        })
 
-    if not rows:
+def parse_spotbugs_xml(xml_path: str, out_csv: str):
+    """
+    Streams the bug rows into a temp file and swaps it in for out_csv only
+    once the whole XML has been parsed, so a truncated or malformed report
+    never replaces an existing CSV with a partial one. Nothing is written
+    when there are no bugs.
+    """
+    tmp_csv = out_csv + ".tmp"
+    count = 0
+    try:
+        with open(tmp_csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDNAMES)
+            for row in iter_bug_rows(xml_path):
+                writer.writerow(row)
+                count += 1
+        if count:
+            os.replace(tmp_csv, out_csv)
+    finally:
+        if os.path.exists(tmp_csv):
+            os.remove(tmp_csv)
+
+    if not count:
         print("No bugs found in SpotBugs XML (or parse failed).")
         return
 
-    with open(out_csv, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=rows[0].keys())
-        writer.writeheader()
-        writer.writerows(rows)
-
-    print(f"Wrote {len(rows)} SpotBugs issues to {out_csv}")
+    print(f"Wrote {count} SpotBugs issues to {out_csv}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,160 @@
+import hashlib
+import io
+import json
+import mmap
+import os
+import re
+
+PROJECT_CACHE_FILE = ".project_src.cache"
+PROJECT_CACHE_META = PROJECT_CACHE_FILE + ".json"
+
+_FILE_MARKER = re.compile(r"^=== FILE: (.+?) ===\n", re.MULTILINE)
+
+
+def _iter_java(root: str):
+    """
+    Recursively yields an os.DirEntry for every .java file under root.
+    The file-type checks use the type cached in each DirEntry, so no
+    extra stat() call is made per entry.
+    """
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _iter_java(entry.path)
+            elif entry.name.endswith(".java") and entry.is_file():
+                yield entry
+
+
+def _scan_java_files(src_dir: str) -> list[tuple[str, str, int, int]]:
+    """
+    Returns a sorted list of (relpath, full_path, mtime_ns, size) tuples for
+    every .java file under src_dir.
+    """
+    found = []
+    for entry in _iter_java(src_dir):
+        st = entry.stat()
+        found.append((os.path.relpath(entry.path, src_dir), entry.path, st.st_mtime_ns, st.st_size))
+    found.sort()
+    return found
+
+
+def _fingerprint(src_dir: str, java_files: list[tuple[str, str, int, int]]) -> str:
+    """
+    Hashes the directory listing (path, mtime, size) so we can tell whether
+    any .java file was added, removed or modified since the last run.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(os.path.abspath(src_dir).encode("utf-8"))
+    for relpath, _, mtime_ns, size in java_files:
+        h.update(f"\0{relpath}\0{mtime_ns}\0{size}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _read_cache(fingerprint: str) -> str | None:
+    """
+    Returns the cached project source if the sidecar fingerprint matches,
+    otherwise None.
+    """
+    try:
+        with open(PROJECT_CACHE_META, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("fingerprint") != fingerprint:
+            return None
+        with open(PROJECT_CACHE_FILE, "rb") as f:
+            if os.fstat(f.fileno()).st_size != meta.get("size"):
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return str(mm, "utf-8")
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(fingerprint: str, data: bytes) -> None:
+    """
+    Stores the concatenated source (UTF-8 bytes) next to a JSON sidecar
+    holding its fingerprint. Both files are written to a temp name first and
+    then swapped in, so an interrupted run never leaves a half-written cache
+    behind.
+    """
+    try:
+        with open(PROJECT_CACHE_FILE + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(PROJECT_CACHE_FILE + ".tmp", PROJECT_CACHE_FILE)
+
+        with open(PROJECT_CACHE_META + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint, "size": len(data)}, f)
+        os.replace(PROJECT_CACHE_META + ".tmp", PROJECT_CACHE_META)
+    except OSError as e:
+        print(f"Could not write project source cache: {e}")
+
+
+def load_project_source(src_dir: str) -> str:
+    """
+    Reads all .java files under src_dir and returns them as one big string.
+    Each file is prefixed with a marker so the model knows which file is which:
+
+    === FILE: Hospital.java ===
+    ...code...
+
+    === FILE: Doctor.java ===
+    ...code...
+
+    The result is cached in PROJECT_CACHE_FILE and reused as long as no .java
+    file under src_dir was added, removed or modified.
+    """
+    java_files = _scan_java_files(src_dir)
+    if not java_files:
+        raise RuntimeError(f"No .java files found under {src_dir}")
+
+    fingerprint = _fingerprint(src_dir, java_files)
+    cached = _read_cache(fingerprint)
+    if cached is not None:
+        return cached
+
+    # Build the same text as format_project_files(), but as bytes, so every
+    # file is copied only once and nothing has to be decoded until the end.
+    buf = io.BytesIO()
+    for i, (relpath, full_path, _, _) in enumerate(java_files):
+        with open(full_path, "rb") as f:
+            code = f.read()
+        if b"\r" in code:
+            # same newline handling as reading in text mode
+            code = code.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        if i:
+            buf.write(b"\n")
+        buf.write(b"=== FILE: ")
+        buf.write(os.path.basename(relpath).encode("utf-8"))
+        buf.write(b" ===\n")
+        buf.write(code)
+        buf.write(b"\n")
+    data = buf.getvalue()
+
+    _write_cache(fingerprint, data)
+    return data.decode("utf-8")
+
+
+def format_project_files(files: list[tuple[str, str]]) -> str:
+    """
+    Inverse of split_project_source(): joins (filename, code) pairs back into
+    the '=== FILE: <name> ===' format used in the prompts.
+    """
+    return "\n".join(f"=== FILE: {fname} ===\n{code}\n" for fname, code in files)
+
+
+def split_project_source(project_code: str) -> list[tuple[str, str]]:
+    """
+    Splits the output of load_project_source() back into (filename, code)
+    pairs, keeping the original file order. The markers only hold the base
+    name, so the same name can appear more than once (e.g. a/Util.java and
+    b/Util.java); every file is kept.
+    """
+    markers = list(_FILE_MARKER.finditer(project_code))
+    files = []
+    for i, m in enumerate(markers):
+        if i + 1 < len(markers):
+            # "<code>\n" followed by the "\n" separator before the next marker
+            code = project_code[m.end():markers[i + 1].start() - 2]
+        else:
+            code = project_code[m.end():-1]
+        files.append((m.group(1), code))
+    return files
@@ -1,35 +1,11 @@
-import os
-import requests
+import io
 
-HOSPITAL_SRC_DIR = r"C:\Users\vigne\Downloads\spotbugs"
-
-OLLAMA_MODEL = "llama3.2"
-
-OLLAMA_URL = "http://localhost:11434/api/generate"
+import orjson
 
+from ollama_client import OLLAMA_KEEP_ALIVE, OLLAMA_MODEL, OLLAMA_OPTIONS, OLLAMA_SESSION, OLLAMA_URL
+from project_source import load_project_source
 
-def load_project_source(src_dir: str) -> str:
-    """
-    Reads all .java files under src_dir and returns them as one big string.
-    Each file is prefixed with a marker so the model knows which file is which:
-
-    === FILE: Hospital.java ===
-    ...code...
-
-    === FILE: Doctor.java ===
-    ...code...
-    """
-    parts = []
-    for root, _, files in os.walk(src_dir):
-        for fname in files:
-            if fname.endswith(".java"):
-                full_path = os.path.join(root, fname)
-                with open(full_path, "r", encoding="utf-8") as f:
-                    code = f.read()
-                parts.append(f"=== FILE: {fname} ===\n{code}\n")
-    if not parts:
-        raise RuntimeError(f"No .java files found under {src_dir}")
-    return "\n".join(parts)
+HOSPITAL_SRC_DIR = r"C:\Users\vigne\Downloads\spotbugs"
 
 
 def build_comprehension_prompt(project_code: str) -> str:
@@ -76,23 +52,35 @@ Each file starts with a '=== FILE: <name> ===' marker:
 
 def call_ollama(prompt: str) -> str:
     """
-    Calls the local Ollama /api/generate endpoint with stream=false.
-    We expect the model's 'response' field to be an HTML fragment as plain text.
+    Calls the local Ollama /api/generate endpoint with stream=true.
+    We expect the model's 'response' fields to form an HTML fragment as plain text.
     """
     payload = {
         "model": OLLAMA_MODEL,
         "prompt": prompt,
         # Do NOT set "format": "json" because we want free-form HTML text.
-        "stream": False,
+        "stream": True,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": OLLAMA_OPTIONS,
     }
 
-    resp = requests.post(OLLAMA_URL, json=payload, timeout=300)
-    resp.raise_for_status()
-    data = resp.json()
-
-    # 'response' contains the model's text output (an HTML fragment).
-    html_fragment = data["response"]
-    return html_fragment
+    html_fragment = io.StringIO()
+    with OLLAMA_SESSION.post(OLLAMA_URL, json=payload, stream=True, timeout=300) as resp:
+        resp.raise_for_status()
+
+        # Ollama sends one JSON object per line; 'response' holds the next
+        # piece of the model's text output (an HTML fragment).
+        for line in resp.iter_lines(chunk_size=64 * 1024):
+            if not line:
+                continue
+            chunk = orjson.loads(line)
+            if "error" in chunk:
+                raise RuntimeError(f"Ollama returned an error: {chunk['error']}")
+            html_fragment.write(chunk.get("response", ""))
+            if chunk.get("done"):
+                break
+
+    return html_fragment.getvalue()
 
 
 def build_html_page(body_html: str) -> str: